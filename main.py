@@ -1,10 +1,16 @@
+from __future__ import annotations
+
 import aiohttp
 import asyncio
+import functools
 import logging
-import time
-import asyncio
-import logging
+import math
 import os
+import signal
+import time
+
+from dataclasses import dataclass
+from typing import Optional
 
 from deebot_client.api_client import ApiClient as DeebotClient
 from deebot_client.authentication import Authenticator, create_rest_config
@@ -12,52 +18,234 @@ from deebot_client.events import GpsPositionEvent, BatteryEvent, PositionsEvent
 from deebot_client.mqtt_client import MqttClient, create_mqtt_config
 from deebot_client.util import md5
 from deebot_client.device import Device
-from traccar_client import send_osmand_position
+from traccar_client import send_osmand_position, send_osmand_positions
 
-device_id = md5(str(time.time()))
+def _load_or_create_device_id(path):
+    """Reuse one device id across restarts.
+
+    A fresh id per process forces the Ecovacs cloud and Traccar to treat each
+    restart as a brand-new device, defeating server-side deduplication. Read
+    the cached id if present, otherwise generate one and write it atomically.
+    """
+    try:
+        with open(path) as f:
+            cached = f.read().strip()
+        if cached:
+            return cached
+    except OSError:
+        pass
+    new_id = md5(str(time.time()))
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(new_id)
+        os.replace(tmp_path, path)
+    except OSError:
+        logging.warning("Could not persist device id to %s; using a fresh one", path)
+    return new_id
+
+device_id = os.getenv("ECOVACS_DEVICE_ID") or _load_or_create_device_id(
+    os.getenv("ECOVACS_DEVICE_ID_FILE", "/var/lib/ecovacs/device_id")
+)
 account_id = os.getenv("ECOVACS_EMAIL")
 password_hash = md5(os.getenv("ECOVACS_PASSWORD"))
+# Normalized once here so nothing downstream re-uppercases per use
 country = os.getenv("COUNTRY_CODE")
+if country:
+    country = country.upper()
 traccar_url = os.getenv("TRACCAR_URL")
+# Maximum positions the worker batches into a single POST when the queue has
+# a backlog; 1 keeps the per-position GET path only.
+buffer_size = int(os.getenv("TRACCAR_BUFFER_SIZE", "50"))
+# Opt-in: send single positions as JSON POSTs to the Traccar REST endpoint
+# instead of OsmAnd GET querystrings.
+use_json = os.getenv("TRACCAR_USE_JSON", "").lower() in ("1", "true", "yes")
+
+http_session = None
+pos_queue = None
+
+# Config objects are pure functions of their inputs; cache them so a future
+# multi-bot refactor cannot accidentally rebuild one per device or per event.
+@functools.lru_cache(maxsize=4)
+def _rest_config(session, dev_id, alpha_2_country):
+    return create_rest_config(session, device_id=dev_id, alpha_2_country=alpha_2_country)
+
+@functools.lru_cache(maxsize=4)
+def _mqtt_config(dev_id, mqtt_country):
+    return create_mqtt_config(device_id=dev_id, country=mqtt_country)
+
+@dataclass
+class BotState:
+    """Mutable per-bot state shared between the event handlers.
 
-lastKnownBattery = None
+    Closed over by the handlers rather than kept in module globals so a
+    future multi-bot deployment gets its own state per device.
+    """
+    last_battery: Optional[float] = None
 
-async def sendGpsPositionToTraccar(bot: Device, event: GpsPositionEvent):
-    global lastKnownBattery
+# Coalescing thresholds: a docked vacuum emits many near-identical positions,
+# so skip updates that moved less than ~5 m and changed battery by less than
+# 1%, but always send a heartbeat at least every 60 seconds.
+_MIN_DISTANCE_M = 5.0
+_MIN_BATTERY_DELTA = 1.0
+_HEARTBEAT_SECONDS = 60.0
+_last_sent = {"lat": None, "lon": None, "batt": None, "t": 0.0}
+
+def _should_send(lat, lon, batt):
+    if _last_sent["lat"] is None:
+        return True
+    if time.monotonic() - _last_sent["t"] >= _HEARTBEAT_SECONDS:
+        return True
+    # Equirectangular approximation; plenty accurate at these distances.
+    dx = (lat - _last_sent["lat"]) * 111_320
+    dy = (lon - _last_sent["lon"]) * 111_320 * math.cos(math.radians(lat))
+    if dx * dx + dy * dy >= _MIN_DISTANCE_M * _MIN_DISTANCE_M:
+        return True
+    if batt is not None and (
+        _last_sent["batt"] is None or abs(batt - _last_sent["batt"]) >= _MIN_BATTERY_DELTA
+    ):
+        return True
+    return False
+
+async def sendGpsPositionToTraccar(bot: Device, state: BotState, event: GpsPositionEvent, session: aiohttp.ClientSession):
+    if not _should_send(event.latitude, event.longitude, state.last_battery):
+        return
     did = bot.device_info["did"]
-    await send_osmand_position(traccar_url, did, event.latitude, event.longitude, battery=lastKnownBattery)
+    payload = {
+        "traccar_url": traccar_url,
+        "device_id": did,
+        "lat": event.latitude,
+        "lon": event.longitude,
+        "battery": state.last_battery,
+        "session": session,
+        "use_json": use_json,
+    }
+    # Only enqueue here so the MQTT event handler never waits on Traccar;
+    # the background worker performs the actual POST.
+    try:
+        pos_queue.put_nowait(payload)
+    except asyncio.QueueFull:
+        # Drop the oldest pending position; the newest fix supersedes it.
+        try:
+            pos_queue.get_nowait()
+            pos_queue.task_done()
+        except asyncio.QueueEmpty:
+            pass
+        pos_queue.put_nowait(payload)
+    _last_sent.update(
+        lat=event.latitude, lon=event.longitude, batt=state.last_battery, t=time.monotonic()
+    )
+
+# Transient Traccar outages are retried with exponential backoff before the
+# batch is dropped, so a blip never crashes the worker or floods the logs.
+_MAX_SEND_ATTEMPTS = 5
+
+async def _send_batch(batch):
+    for attempt in range(_MAX_SEND_ATTEMPTS):
+        try:
+            if len(batch) == 1:
+                await send_osmand_position(**batch[0])
+            else:
+                positions = []
+                for item in batch:
+                    position = {"id": item["device_id"], "lat": item["lat"], "lon": item["lon"]}
+                    if item["battery"] is not None:
+                        position["batt"] = item["battery"]
+                    positions.append(position)
+                await send_osmand_positions(
+                    batch[0]["traccar_url"], positions, session=batch[0]["session"]
+                )
+            return
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt == _MAX_SEND_ATTEMPTS - 1:
+                logging.exception(
+                    "Dropping %d position(s) after %d failed attempts",
+                    len(batch), _MAX_SEND_ATTEMPTS,
+                )
+                return
+            await asyncio.sleep(min(30, 2 ** attempt))
+
+async def _traccar_worker(queue: asyncio.Queue):
+    while True:
+        # Drain whatever has accumulated so a backlog (e.g. after a network
+        # blip) is flushed in one POST instead of one GET per position.
+        batch = [await queue.get()]
+        while not queue.empty() and len(batch) < buffer_size:
+            batch.append(queue.get_nowait())
+        try:
+            await _send_batch(batch)
+        except Exception:
+            # Never let an unexpected error kill the worker loop.
+            logging.exception("Failed to send %d position(s) to Traccar", len(batch))
+        finally:
+            for _ in batch:
+                queue.task_done()
 
 async def main():
-  async with aiohttp.ClientSession() as session:
-    logging.basicConfig(level=logging.DEBUG)
-    rest_config = create_rest_config(session, device_id=device_id, alpha_2_country=country)
+    global http_session, pos_queue
+    # Default to INFO so per-event DEBUG formatting in aiohttp/deebot_client
+    # stays off the hot path; set LOG_LEVEL=DEBUG to turn it back on.
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    # One session for the whole process so every Traccar post reuses the same
+    # keep-alive connection pool; closed below once the stop signal arrives.
+    # Each host (Ecovacs API, Traccar) talks over one pinned persistent
+    # connection; no total limit since the session is shared across hosts.
+    http_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit_per_host=1,
+            keepalive_timeout=120,
+            enable_cleanup_closed=True,
+            ttl_dns_cache=600,
+        )
+    )
+    session = http_session
+    pos_queue = asyncio.Queue(maxsize=256)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+      loop.add_signal_handler(sig, stop.set)
+
+    try:
+      async with asyncio.TaskGroup() as tg:
+        worker_task = tg.create_task(_traccar_worker(pos_queue))
+
+        rest_config = _rest_config(session, device_id, country)
+
+        authenticator = Authenticator(rest_config, account_id, password_hash)
+        deebot_api_client = DeebotClient(authenticator)
+
+        devices_ = await deebot_api_client.get_devices()
+
+        bot = Device(devices_.mqtt[0], authenticator)
 
-    authenticator = Authenticator(rest_config, account_id, password_hash)
-    deebot_api_client = DeebotClient(authenticator)
+        mqtt_config = _mqtt_config(device_id, country)
+        mqtt = MqttClient(mqtt_config, authenticator)
+        await bot.initialize(mqtt)
 
-    devices_ = await deebot_api_client.get_devices()
+        state = BotState()
 
-    bot = Device(devices_.mqtt[0], authenticator)
+        async def on_gps_position(event: GpsPositionEvent):
+          await sendGpsPositionToTraccar(bot, state, event, session)
 
-    mqtt_config = create_mqtt_config(device_id=device_id, country=country)
-    mqtt = MqttClient(mqtt_config, authenticator)
-    await bot.initialize(mqtt)
+        async def on_battery(event: BatteryEvent):
+          state.last_battery = event.value
 
-    async def on_gps_position(event: GpsPositionEvent):
-      await sendGpsPositionToTraccar(bot, event)
-    
-    async def on_battery(event: BatteryEvent):
-      global lastKnownBattery
-      lastKnownBattery = event.value
+        async def on_positions(event: PositionsEvent):
+          logging.debug("POS %s", event)
 
-    async def on_positions(event: PositionsEvent):
-      print("POS", event)
+        bot.events.subscribe(GpsPositionEvent, on_gps_position)
+        bot.events.subscribe(BatteryEvent, on_battery)
+        bot.events.subscribe(PositionsEvent, on_positions)
 
-    bot.events.subscribe(GpsPositionEvent, on_gps_position)
-    bot.events.subscribe(BatteryEvent, on_battery)
-    bot.events.subscribe(PositionsEvent, on_positions)
+        # Run until SIGINT/SIGTERM, then flush queued positions before the
+        # worker is cancelled and the group unwinds.
+        await stop.wait()
+        await pos_queue.join()
+        worker_task.cancel()
+    finally:
+      await http_session.close()
 
 if __name__ == '__main__':
-  loop = asyncio.get_event_loop()
-  loop.create_task(main())
-  loop.run_forever()
+  asyncio.run(main())
@@ -7,11 +7,62 @@ using the OsmAnd protocol.
 Full specification: https://www.traccar.org/osmand/
 """
 
+import functools
+import json
+import logging
+
 import aiohttp
+import yarl
 from typing import Optional
 from datetime import datetime
-from urllib.parse import urlencode
 
+# orjson serializes dict-heavy payloads several times faster than the stdlib;
+# fall back transparently when it is not installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def _dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+# Value transforms for optional OsmAnd parameters
+_bool = lambda b: "true" if b else "false"
+_millis = lambda ts: int(ts.timestamp() * 1000)
+
+
+@functools.lru_cache(maxsize=4)
+def _base_url(traccar_url: str) -> yarl.URL:
+    """Parse and cache the server base URL; it is constant across calls."""
+    return yarl.URL(traccar_url.rstrip('/'))
+
+
+# ClientTimeout is immutable, so one instance per distinct timeout value can
+# be shared across calls instead of rebuilding it per request.
+_TIMEOUT_CACHE: dict = {}
+
+
+def _client_timeout(timeout: int) -> aiohttp.ClientTimeout:
+    t = _TIMEOUT_CACHE.get(timeout)
+    if t is None:
+        t = _TIMEOUT_CACHE.setdefault(timeout, aiohttp.ClientTimeout(total=timeout))
+    return t
+
+
+@functools.lru_cache(maxsize=8)
+def _static_params(device_id: str) -> dict:
+    """Cache the per-device constant query parameters.
+
+    The returned dict must not be mutated; spread it into a fresh dict.
+    """
+    return {"id": device_id}
 
 async def send_osmand_position(
     traccar_url: str,
@@ -29,8 +80,9 @@ async def send_osmand_position(
     charge: Optional[bool] = None,
     valid: Optional[bool] = None,
     driver_unique_id: Optional[str] = None,
-    session: Optional[aiohttp.ClientSession] = None,
+    session: aiohttp.ClientSession,
     timeout: int = 30,
+    use_json: bool = False,
     **custom_attributes
 ) -> bool:
     """
@@ -51,142 +103,178 @@ async def send_osmand_position(
         charge: Whether device is charging (True/False)
         valid: Whether the GPS position is valid
         driver_unique_id: Driver identifier
-        session: Optional aiohttp.ClientSession (will create one if not provided)
+        session: aiohttp.ClientSession used for the request; the caller owns
+            the session and is responsible for closing it
         timeout: Request timeout in seconds
+        use_json: POST the position as a JSON body to the Traccar REST
+            endpoint instead of the OsmAnd GET querystring; keep False for
+            OsmAnd-only deployments
         **custom_attributes: Additional custom attributes to send with the position
 
     Returns:
         bool: True if request was successful, False otherwise
 
     Raises:
-        ValueError: If required parameters are invalid
+        ValueError: If lat/lon are out of range (checked only when running
+            without ``python -O``)
         aiohttp.ClientError: If network request fails
 
     Examples:
         >>> # Basic usage with required parameters only
-        >>> await send_osmand_position(
-        ...     traccar_url="http://localhost:5055",
-        ...     device_id="robot-vacuum-001",
-        ...     lat=37.7749,
-        ...     lon=-122.4194
-        ... )
+        >>> async with aiohttp.ClientSession() as session:
+        ...     await send_osmand_position(
+        ...         traccar_url="http://localhost:5055",
+        ...         device_id="robot-vacuum-001",
+        ...         lat=37.7749,
+        ...         lon=-122.4194,
+        ...         session=session
+        ...     )
 
         >>> # With optional parameters
-        >>> await send_osmand_position(
-        ...     traccar_url="http://localhost:5055",
-        ...     device_id="robot-vacuum-001",
-        ...     lat=37.7749,
-        ...     lon=-122.4194,
-        ...     speed=5.2,
-        ...     bearing=180,
-        ...     altitude=10,
-        ...     battery=85,
-        ...     charge=True
-        ... )
+        >>> async with aiohttp.ClientSession() as session:
+        ...     await send_osmand_position(
+        ...         traccar_url="http://localhost:5055",
+        ...         device_id="robot-vacuum-001",
+        ...         lat=37.7749,
+        ...         lon=-122.4194,
+        ...         speed=5.2,
+        ...         bearing=180,
+        ...         altitude=10,
+        ...         battery=85,
+        ...         charge=True,
+        ...         session=session
+        ...     )
 
         >>> # With custom attributes
-        >>> await send_osmand_position(
-        ...     traccar_url="http://localhost:5055",
-        ...     device_id="robot-vacuum-001",
-        ...     lat=37.7749,
-        ...     lon=-122.4194,
-        ...     cleaning_mode="auto",
-        ...     room="living_room"
-        ... )
-
-        >>> # Reusing a session for multiple requests
         >>> async with aiohttp.ClientSession() as session:
         ...     await send_osmand_position(
         ...         traccar_url="http://localhost:5055",
         ...         device_id="robot-vacuum-001",
         ...         lat=37.7749,
         ...         lon=-122.4194,
+        ...         cleaning_mode="auto",
+        ...         room="living_room",
         ...         session=session
         ...     )
     """
-    # Validate required parameters
-    if not device_id:
-        raise ValueError("device_id is required")
-    if not isinstance(lat, (int, float)) or not -90 <= lat <= 90:
-        raise ValueError("lat must be a number between -90 and 90")
-    if not isinstance(lon, (int, float)) or not -180 <= lon <= 180:
-        raise ValueError("lon must be a number between -180 and 180")
-
-    # Build parameters dictionary
+    # Range-check coordinates with plain float comparisons; values come from
+    # GpsPositionEvent and are always numbers, so no isinstance dispatch is
+    # needed. Elided entirely under python -O.
+    if __debug__:
+        if not (-90.0 <= lat <= 90.0):
+            raise ValueError("lat must be a number between -90 and 90")
+        if not (-180.0 <= lon <= 180.0):
+            raise ValueError("lon must be a number between -180 and 180")
+
+    # Optional parameters as (key, value, transform) specs; timestamps become
+    # Unix milliseconds and booleans become "true"/"false" strings.
+    optional = (
+        ("timestamp", timestamp, _millis),
+        ("speed", speed, None),
+        ("bearing", bearing, None),
+        ("altitude", altitude, None),
+        ("accuracy", accuracy, None),
+        ("hdop", hdop, None),
+        ("batt", battery, None),
+        ("charge", charge, _bool),
+        ("valid", valid, _bool),
+        ("driverUniqueId", driver_unique_id, None),
+    )
+
+    # Build the parameters dict in one expression; the constant device id
+    # fragment is cached so only the per-call fields are encoded.
     params = {
-        "id": device_id,
+        **_static_params(device_id),
         "lat": lat,
         "lon": lon,
+        **{k: (f(v) if f else v) for k, v, f in optional if v is not None},
+        **custom_attributes,
     }
 
-    # Add optional parameters if provided
-    if timestamp is not None:
-        # Convert datetime to Unix timestamp (milliseconds)
-        params["timestamp"] = int(timestamp.timestamp() * 1000)
-
-    if speed is not None:
-        params["speed"] = speed
-
-    if bearing is not None:
-        params["bearing"] = bearing
-
-    if altitude is not None:
-        params["altitude"] = altitude
+    if use_json:
+        # JSON body avoids URL-length limits as custom attributes grow and
+        # serializes faster than the pure-Python urlencode path.
+        response = await session.post(
+            _base_url(traccar_url) / "api/positions",
+            data=_dumps([params]),
+            headers=_JSON_HEADERS,
+            timeout=_client_timeout(timeout)
+        )
+    else:
+        # Send GET request to Traccar (base URL parsed once and cached)
+        response = await session.get(
+            _base_url(traccar_url),
+            params=params,
+            timeout=_client_timeout(timeout)
+        )
+    try:
+        # Traccar returns 200 OK (202 Accepted on the REST path) on success
+        if response.status not in (200, 202):
+            # Read the body only on the error path, for the exception message
+            error_text = await response.text()
+            raise aiohttp.ClientError(
+                f"Traccar request failed with status {response.status}: {error_text}"
+            )
+        if logger.isEnabledFor(logging.DEBUG):
+            # Guarded so the success path pays no formatting cost at
+            # INFO and above.
+            logger.debug("Traccar request succeeded with status %s", response.status)
+        return True
+    finally:
+        # Traccar's OK body is trivial; release the connection back to the
+        # pool without buffering the payload.
+        response.release()
 
-    if accuracy is not None:
-        params["accuracy"] = accuracy
 
-    if hdop is not None:
-        params["hdop"] = hdop
+async def send_osmand_positions(
+    traccar_url: str,
+    positions: list,
+    *,
+    session: aiohttp.ClientSession,
+    timeout: int = 30,
+) -> bool:
+    """
+    Send multiple positions to Traccar in a single POST request.
 
-    if battery is not None:
-        params["batt"] = battery
+    Used when several updates are pending (e.g. after a network blip) so the
+    backlog costs one round-trip instead of one GET per position.
 
-    if charge is not None:
-        params["charge"] = "true" if charge else "false"
+    Args:
+        traccar_url: Base URL of the Traccar server
+        positions: List of position dicts in OsmAnd parameter form
+            (e.g. ``{"id": ..., "lat": ..., "lon": ..., "batt": ...}``)
+        session: aiohttp.ClientSession used for the request; the caller owns
+            the session and is responsible for closing it
+        timeout: Request timeout in seconds
 
-    if valid is not None:
-        params["valid"] = "true" if valid else "false"
+    Returns:
+        bool: True if request was successful, False otherwise
 
-    if driver_unique_id is not None:
-        params["driverUniqueId"] = driver_unique_id
+    Raises:
+        aiohttp.ClientError: If network request fails
+    """
+    if not positions:
+        return True
 
-    # Add any custom attributes
-    params.update(custom_attributes)
+    url = _base_url(traccar_url) / "api/positions"
 
-    # Construct the full URL
-    url = traccar_url.rstrip('/')
+    async with session.post(
+        url,
+        data=_dumps(positions),
+        headers=_JSON_HEADERS,
+        timeout=_client_timeout(timeout)
+    ) as response:
+        success = response.status in (200, 202)
 
-    # Determine if we need to manage the session
-    close_session = False
-    if session is None:
-        session = aiohttp.ClientSession()
-        close_session = True
+        if not success:
+            error_text = await response.text()
+            raise aiohttp.ClientError(
+                f"Traccar batch request failed with status {response.status}: {error_text}"
+            )
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Traccar batch of %d positions succeeded with status %s",
+                len(positions), response.status,
+            )
 
-    try:
-        # Send GET request to Traccar
-        async with session.get(
-            url,
-            params=params,
-            timeout=aiohttp.ClientTimeout(total=timeout)
-        ) as response:
-            # Traccar returns 200 OK on success
-            success = response.status == 200
-
-            if not success:
-                # Log the error response for debugging
-                error_text = await response.text()
-                raise aiohttp.ClientError(
-                    f"Traccar request failed with status {response.status}: {error_text}"
-                )
-            else:
-                # Log the success response for debugging
-                print(f"Traccar request succeeded with status {response.status}")
-
-            return success
-
-    except Exception as e:
-        raise
-    finally:
-        if close_session:
-            await session.close()
+        return success